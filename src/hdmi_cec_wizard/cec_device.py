@@ -3,9 +3,187 @@ import subprocess
 from subprocess import CompletedProcess
 import shlex
 import re
+import time
+import threading
+from contextlib import contextmanager
 from .exceptions import *
 
 
+class Deadline ():
+    """
+        Time limit shared by every step of an operation. Every method accepting a timeout also accept a Deadline,
+        so a caller can share the same time limit between multiple commands
+
+        :param timeout: Time in seconds allowed for the operation. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+    """
+    def __init__(self, timeout: float = None) -> None:
+        if timeout is None :
+            timeout = LocalCECDevice.DEFAULT_TIMEOUT
+
+        self.timeout = timeout
+        self.expire_at = None if timeout is None else time.monotonic() + timeout
+
+
+    @classmethod
+    def of(cls, timeout = None) -> 'Deadline':
+        """
+            Return timeout as a Deadline
+
+            :param timeout: Either a Deadline, returned as is, or a time in seconds (None for LocalCECDevice.DEFAULT_TIMEOUT)
+        """
+        if isinstance(timeout, Deadline) :
+            return timeout
+
+        return cls(timeout)
+
+
+    def left(self) -> float:
+        """
+            Return the time left before the deadline
+
+            :return: Time left in seconds, 0 if expired, or None if there is no time limit
+        """
+        if self.expire_at is None :
+            return None
+
+        return max(self.expire_at - time.monotonic(), 0)
+
+
+    def check(self) -> None:
+        """
+            Check the deadline did not expire yet, call it before starting a new step
+
+            :raise CommandTimeoutException: If the deadline expired
+        """
+        if self.left() == 0 :
+            raise CommandTimeoutException('Deadline of {:.2f} seconds expired before the command could be sent.'.format(self.timeout), 
+                                          self.timeout)
+
+
+class ReadWriteLock ():
+    """
+        Lock shared by every user of a /dev/cecX. Transmits take it shared, so they never wait for each other,
+        while (re)configuring the adapter take it exclusively, so it never happen in the middle of a transmit.
+        Waiting writers have priority over new readers, so a reconfiguration cannot be starved by a stream of transmits
+
+        The lock is not reentrant, do not take it again from a thread already holding it
+    """
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+
+
+    def __wait(self, predicate, deadline: Deadline) -> None:
+        """
+            Wait, with self.condition held, until predicate is True or the deadline expire
+
+            :raise CommandTimeoutException: If the deadline expired before predicate became True
+        """
+        if not self.condition.wait_for(predicate, deadline.left()) :
+            raise CommandTimeoutException('Deadline of {:.2f} seconds expired while waiting for the bus.'.format(deadline.timeout), 
+                                          deadline.timeout)
+
+
+    @contextmanager
+    def read(self, timeout = None):
+        """
+            Hold the lock shared for the duration of a with block
+
+            :param timeout: Time in seconds or Deadline allowed to wait for the lock. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+            :raise CommandTimeoutException: If the lock could not be acquired in time
+        """
+        deadline = Deadline.of(timeout)
+        with self.condition :
+            self.__wait(lambda: not self.writer and not self.waiting_writers, deadline)
+            self.readers += 1
+
+        try :
+            yield self
+        finally :
+            with self.condition :
+                self.readers -= 1
+                if not self.readers :
+                    self.condition.notify_all()
+
+
+    @contextmanager
+    def write(self, timeout = None):
+        """
+            Hold the lock exclusively for the duration of a with block
+
+            :param timeout: Time in seconds or Deadline allowed to wait for the lock. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+            :raise CommandTimeoutException: If the lock could not be acquired in time
+        """
+        deadline = Deadline.of(timeout)
+        with self.condition :
+            self.waiting_writers += 1
+            try :
+                self.__wait(lambda: not self.writer and not self.readers, deadline)
+            finally :
+                self.waiting_writers -= 1
+                # Readers might have been waiting only for us
+                self.condition.notify_all()
+            self.writer = True
+
+        try :
+            yield self
+        finally :
+            with self.condition :
+                self.writer = False
+                self.condition.notify_all()
+
+
+def start_command(command_parts: list) -> subprocess.Popen:
+    """
+        Start a command in background, use wait_command to get its result
+
+        :param command_parts: The command and its arguments
+    """
+    # We do not use a shell so the timeout kill the cec-ctl process itself and not only its parent shell
+    return subprocess.Popen(command_parts, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def wait_command(process: subprocess.Popen, timeout = None) -> CompletedProcess:
+    """
+        Wait for a command started with start_command and return result, killing it if it does not complete in time
+
+        :param process: The process returned by start_command
+        :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+
+        :raise CommandTimeoutException: If the command did not complete in time, the process is killed before raising
+    """
+    deadline = Deadline.of(timeout)
+
+    # A completed command only need its output to be read, so never time it out even if the deadline expired
+    left = None if process.poll() is not None else deadline.left()
+    try :
+        stdout, stderr = process.communicate(timeout=left)
+    except subprocess.TimeoutExpired as e :
+        process.kill()
+        process.communicate()
+        raise CommandTimeoutException('Command {} did not complete in {:.2f} seconds.'.format(shlex.join(process.args), deadline.timeout), 
+                                      deadline.timeout) from e
+
+    return CompletedProcess(process.args, process.returncode, stdout, stderr)
+
+
+def run_command(command_parts: list, timeout = None) -> CompletedProcess:
+    """
+        Run a command and return result, killing it if it does not complete in time
+
+        :param command_parts: The command and its arguments
+        :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+
+        :raise CommandTimeoutException: If the deadline expired before starting the command, or if the command did not complete in time
+    """
+    deadline = Deadline.of(timeout)
+    deadline.check()
+
+    return wait_command(start_command(command_parts), timeout=deadline)
+
+
 class CECButton(Enum):
     SELECT = {"str": "select", "code": "0x00"}
     UP = {"str": "up", "code": "0x01"}
@@ -100,15 +278,18 @@ class CECButton(Enum):
 class DeviceTypes(Enum):
         """
             Available types of HDMI CEC devices
+
+            'osd_name' is the OSD Name cec-ctl set when configuring this device type without --osd-name,
+            or None if unknown. A switch is configured unregistered and without OSD Name.
         """
-        TV = {'str': 'TV', 'param': '--tv'}  # Television device
-        RECORDER = {'str': 'Recorder', 'param': '--record'}  # Device that records content (DVR)
-        TUNER = {'str': 'Tuner', 'param': '--tuner'}  # Device that tunes and receives broadcast signals
-        PLAYBACK = {'str': 'Playback', 'param': '--playback'}  # Device that plays audio or video content
-        AUDIO = {'str': 'Audio', 'param': '--audio'}  # Device focused on audio playback or processing
-        AMPLIFIER = {'str': 'Amplifier', 'param': '--amplifier'}  # Device that amplifies audio signals
-        SWITCH = {'str': 'Switch', 'param': '--switch'}  # Device that switches HDMI inputs
-        PROCESSOR = {'str': 'Processor', 'param': '--processor'}  # Device that processes audio or video signals
+        TV = {'str': 'TV', 'param': '--tv', 'osd_name': 'TV'}  # Television device
+        RECORDER = {'str': 'Recorder', 'param': '--record', 'osd_name': 'Record'}  # Device that records content (DVR)
+        TUNER = {'str': 'Tuner', 'param': '--tuner', 'osd_name': 'Tuner'}  # Device that tunes and receives broadcast signals
+        PLAYBACK = {'str': 'Playback', 'param': '--playback', 'osd_name': 'Playback'}  # Device that plays audio or video content
+        AUDIO = {'str': 'Audio', 'param': '--audio', 'osd_name': 'Audio System'}  # Device focused on audio playback or processing
+        AMPLIFIER = {'str': 'Amplifier', 'param': '--amplifier', 'osd_name': None}  # Device that amplifies audio signals
+        SWITCH = {'str': 'Switch', 'param': '--switch', 'osd_name': ''}  # Device that switches HDMI inputs
+        PROCESSOR = {'str': 'Processor', 'param': '--processor', 'osd_name': 'Processor'}  # Device that processes audio or video signals
 
 
 class CECDevice ():
@@ -146,46 +327,303 @@ class LocalCECDevice (CECDevice):
         **
 
         :cec_handle: Path to the /dev/cecX UNIX device we use with cec-ctl. Only provided for 
+        :suppress_redundant: If True, send_power_on, send_power_off and broadcast_active_source will be skipped
+            when the known-state cache say the target is already in the requested state. False by default
+        :state_ttl: Time in seconds a state observed from another device answer (ask_power_status, broadcast_request_active_source)
+            stay valid in the cache. 60 by default
+        :sent_state_ttl: Time in seconds a state inferred from a command we sent stay valid in the cache. A sent command only mean
+            the message was acknowledged, not that the device really changed state, so it is 0 (disabled) by default
+        :bus_lock: ReadWriteLock shared by everybody using cec_handle. If None, a new one is created
         :params: All the other params from CECDevice applies
+
+        The known-state cache only know what we asked or sent, it cannot see a device changing state by itself or by another
+        device order (remote control, input switch, another source claiming active source...) so a cached state might be wrong
+        until it expire. Keep the TTLs shorter than the period you re-send your commands.
+
+        Every command accept a timeout, in seconds or as a Deadline, if None LocalCECDevice.DEFAULT_TIMEOUT is used.
+        If the command did not complete before, a CommandTimeoutException is raised.
+
+        A LocalCECDevice can be shared between threads. Every command run its own cec-ctl process and hold bus_lock shared,
+        so commands from multiple threads are sent concurrently, but never while the adapter is being reconfigured.
+        The known-state cache and the commands counts are protected by state_lock.
     """
 
+    # Default time in seconds allowed for every command, library-wide. Set to None to disable time limit
+    DEFAULT_TIMEOUT = 10
+
+    # Minimum time in seconds allowed for a button release, even if the deadline expired, so a button is never left held
+    RELEASE_MIN_TIMEOUT = 1
+
     REGEX_RESPONSE_PWR_STATE = r'\s+pwr-state:\s+(\w+)\s+\(\w+\)'
     REGEX_RESPONSE_TIMEOUT = r',\s+Timeout'
     REGEX_RESPONSE_FROM = r'\s+Received from .+ (\(\d+\))'
     REGEX_RESPONSE_PHYSICAL_ADDRESS = r'\s+phys-addr: (\w+\.\w+\.\w+\.\w+)'
 
-    def __init__(self, cec_handle: str, *args, **kwargs) -> None:
+    # Logical address used to send a message to every device at once
+    BROADCAST_ADDRESS = '15'
+
+    # Logical address of the TV, when it goes to standby it stop showing any source
+    TV_ADDRESS = '0'
+
+    # Known-state cache keys
+    STATE_POWER_STATUS = 'power_status'
+    STATE_ACTIVE_SOURCE = 'active_source'
+
+    def __init__(self, cec_handle: str, *args, suppress_redundant: bool = False, state_ttl: float = 60, sent_state_ttl: float = 0, 
+                 bus_lock: ReadWriteLock = None, **kwargs) -> None:
         self.cec_handle = cec_handle
+        self.suppress_redundant = suppress_redundant
+        self.state_ttl = state_ttl
+        self.sent_state_ttl = sent_state_ttl
+
+        # Short-lived cache of what we know about other devices (and ourself), indexed by logical address
+        # each entry is a dict of state name -> (value, monotonic time the value expire)
+        self.known_states = {}
+
+        # Count of commands successfully sent on the bus and commands skipped because they would not change anything
+        self.sent_commands = 0
+        self.skipped_commands = 0
+
+        # Shared by every command on cec_handle, and taken exclusively by whoever reconfigure the adapter
+        self.bus_lock = bus_lock if bus_lock else ReadWriteLock()
+
+        # Protect known_states and the commands counts when the device is shared between threads
+        self.state_lock = threading.RLock()
+
         super().__init__(*args, **kwargs)
 
 
-    def run_cec_ctl(self, command_args: list, skip_info: bool = True) -> CompletedProcess:
+    def remember_state(self, logical_address: str, state: str, value, ttl: float = None) -> None:
+        """
+            Store a known state of a device in the known-state cache
+
+            :param logical_address: Logical address of the device the state is about, never the broadcast address
+            :param state: Name of the state, one of the LocalCECDevice.STATE_* constants
+            :param value: The state value. If None, the state is forgotten
+            :param ttl: Time in seconds the state stay valid. If None, self.state_ttl is used. If 0 or less, the state is forgotten
+        """
+        if ttl is None :
+            ttl = self.state_ttl
+
+        with self.state_lock :
+            states = self.known_states.setdefault(logical_address, {})
+            if value is None or ttl <= 0 :
+                states.pop(state, None)
+                return
+
+            states[state] = (value, time.monotonic() + ttl)
+
+
+    def get_known_state(self, logical_address: str, state: str):
+        """
+            Return a known state of a device from the known-state cache
+
+            :param logical_address: Logical address of the device the state is about
+            :param state: Name of the state, one of the LocalCECDevice.STATE_* constants
+            :return: The state value, or None if unknown or expired
+        """
+        with self.state_lock :
+            entry = self.known_states.get(logical_address, {}).get(state)
+        if not entry :
+            return None
+
+        value, expire_at = entry
+        if time.monotonic() >= expire_at :
+            return None
+
+        return value
+
+
+    def forget_states(self) -> None:
+        """
+            Empty the known-state cache, next commands will always be sent
+        """
+        with self.state_lock :
+            self.known_states = {}
+
+
+    def __forget_active_source(self) -> None:
+        """
+            Forget whether we are the active source, so next broadcast_active_source is always sent.
+            Must be called when the display might stop showing us, like when it goes to standby
+        """
+        self.remember_state(self.logical_address, self.STATE_ACTIVE_SOURCE, None)
+
+
+    def get_command_stats(self) -> dict:
+        """
+            Return the count of state-changing commands sent and skipped by the redundant commands suppression
+            Commands that failed are not counted as sent
+
+            :return: A dict with keys 'sent' and 'skipped'
+        """
+        with self.state_lock :
+            return {'sent': self.sent_commands, 'skipped': self.skipped_commands}
+
+
+    def __is_redundant(self, logical_address: str, state: str, value, force: bool) -> bool:
+        """
+            Check if a command would leave the device state unchanged and so can be skipped, counting skipped commands
+            Commands to the broadcast address are never redundant, as we cannot know the state of every device on the bus
+
+            :param logical_address: Logical address of the device targeted by the command
+            :param state: Name of the state the command change
+            :param value: The state value after the command
+            :param force: If True, the command is never considered redundant
+            :return: True if the command must be skipped
+        """
+        if logical_address == self.BROADCAST_ADDRESS :
+            return False
+
+        with self.state_lock :
+            if self.suppress_redundant and not force and self.get_known_state(logical_address, state) == value :
+                self.skipped_commands += 1
+                return True
+
+        return False
+
+
+    def __record_sent(self, logical_address: str, state: str, value) -> None:
+        """
+            Record a successfully sent state-changing command, updating the known-state cache with self.sent_state_ttl and stats
+
+            :param logical_address: Logical address of the device targeted by the command. If the broadcast address,
+                the state of every device in the cache is updated
+            :param state: Name of the state the command changed
+            :param value: The state value after the command
+        """
+        with self.state_lock :
+            logical_addresses = [logical_address]
+            if logical_address == self.BROADCAST_ADDRESS :
+                logical_addresses = [address for address in self.known_states.keys() if address != self.BROADCAST_ADDRESS]
+
+            for address in logical_addresses :
+                self.remember_state(address, state, value, ttl=self.sent_state_ttl)
+
+            self.sent_commands += 1
+
+
+    def run_cec_ctl(self, command_args: list, skip_info: bool = True, timeout = None) -> CompletedProcess:
         """
             Run a cec-ctl command from this device and return result
             :param command_args: Parameters to pass to cec-ctl command. 
-                all args will be escaped with shlex.join
+                all args are passed as is, without going through a shell
 
             :param skip_info: If True skip the driver info output in response. True by default
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
 
             :raise: Raise a CalledProcessError exception if cec-ctl command process return an error code
+            :raise CommandTimeoutException: If the command did not complete in time, including waiting for the adapter reconfiguration
         """
         command_parts = ['cec-ctl', '-d', self.cec_handle]
         if skip_info :
             command_parts.append('--skip-info')
         
-        command = shlex.join(command_parts + command_args)
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        deadline = Deadline.of(timeout)
+        with self.bus_lock.read(deadline) :
+            result = run_command(command_parts + command_args, timeout=deadline)
         result.check_returncode()
         return result
+
+
+    def run_cec_ctl_many(self, commands_args: list, skip_info: bool = True, timeout = None) -> list:
+        """
+            Run multiple cec-ctl commands from this device at once and return results
+            All commands are started together, so their messages are queued back-to-back by the kernel instead
+            of waiting for each other
+
+            :param commands_args: A list of parameters lists, one per cec-ctl command. See run_cec_ctl
+            :param skip_info: If True skip the driver info output in response. True by default
+            :param timeout: Time in seconds or Deadline allowed for all the commands. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+
+            :raise CommandTimeoutException: If the deadline expired before starting the commands, including waiting for the adapter reconfiguration
+            :return: A list with, for each command in the same order, either its CompletedProcess or the exception it raised
+                (CalledProcessError if cec-ctl returned an error code, CommandTimeoutException if it did not complete in time)
+        """
+        deadline = Deadline.of(timeout)
+        deadline.check()
+
+        results = []
+        with self.bus_lock.read(deadline) :
+            processes = []
+            for command_args in commands_args :
+                command_parts = ['cec-ctl', '-d', self.cec_handle]
+                if skip_info :
+                    command_parts.append('--skip-info')
+                processes.append(start_command(command_parts + command_args))
+
+            # Once the deadline passed, wait_command still collect the already completed commands
+            for process in processes :
+                try :
+                    result = wait_command(process, timeout=deadline)
+                    result.check_returncode()
+                    results.append(result)
+                except (subprocess.CalledProcessError, CommandTimeoutException) as e :
+                    results.append(e)
+
+        return results
+
+
+    def __send_to_many(self, to: list, commands_args: list, timeout = None, state: str = None, value = None, 
+                       force: bool = False, broadcast_args: list = None) -> dict:
+        """
+            Send a command to multiple devices, either with one broadcast message or by pipelining unicast messages,
+            skipping the redundant ones and updating the known-state cache
+
+            :param to: The list of target CECDevice
+            :param commands_args: For each target, the cec-ctl parameters sending the command to it
+            :param timeout: Time in seconds or Deadline allowed for all the commands. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+            :param state: Name of the state changed by the command, or None if the command does not change a known state
+            :param value: The state value after the command
+            :param force: If True, never skip redundant commands
+            :param broadcast_args: If not None, cec-ctl parameters to send the command to every device with a single broadcast message.
+                A broadcast reach every device on the bus, so it is never skipped as redundant
+
+            :return: A dict indexed by target logical address, see send_power_off_many
+        """
+        if broadcast_args :
+            try :
+                result = self.run_cec_ctl(broadcast_args, timeout=timeout)
+            except (subprocess.CalledProcessError, CommandTimeoutException) as e :
+                result = e
+
+            if state and isinstance(result, CompletedProcess) :
+                for device in to :
+                    self.remember_state(device.logical_address, state, value, ttl=self.sent_state_ttl)
+                self.__record_sent(self.BROADCAST_ADDRESS, state, value)
+
+            return {device.logical_address: result for device in to}
+
+        results = {}
+        targets = []
+        targets_args = []
+        for device, command_args in zip(to, commands_args) :
+            if state and self.__is_redundant(device.logical_address, state, value, force) :
+                results[device.logical_address] = None
+                continue
+
+            targets.append(device)
+            targets_args.append(command_args)
+
+        if not targets :
+            return results
+
+        for device, result in zip(targets, self.run_cec_ctl_many(targets_args, timeout=timeout)) :
+            results[device.logical_address] = result
+            if state and isinstance(result, CompletedProcess) :
+                self.__record_sent(device.logical_address, state, value)
+
+        return results
     
 
-    def send_cec_command_to(self, to: CECDevice, opcode: str, payload: str = None) -> CompletedProcess:
+    def send_cec_command_to(self, to: CECDevice, opcode: str, payload: str = None, timeout = None) -> CompletedProcess:
         """
             Send a CEC command to a specific device using his logical address
             :param to: The CECDevice to send the command to
             :param opcode: The CEC command opcode, as a string. Ex: 0x44 (press button)
             :param payload: The command paylod if any (including operands if any). By default None.
                 Ex: 0x41 -> Volume up for press button, or 0x10:0x00 for the address part of the active-source command
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
         
             :raise: Raise a CalledProcessError exception if cec-ctl command process return an error code
         """
@@ -193,10 +631,10 @@ class LocalCECDevice (CECDevice):
         if payload :
             cmd = '{},payload={}'.format(cmd, payload)
 
-        return self.run_cec_ctl(['--to', to.logical_address, '--custom-command', cmd])
+        return self.run_cec_ctl(['--to', to.logical_address, '--custom-command', cmd], timeout=timeout)
     
 
-    def send_button_press(self, to: CECDevice, button: CECButton, auto_release = True) -> CompletedProcess:
+    def send_button_press(self, to: CECDevice, button: CECButton, auto_release = True, timeout = None) -> CompletedProcess:
         """
             Send a CEC command emulating a user pressing a button to the specified device
 
@@ -209,60 +647,126 @@ class LocalCECDevice (CECDevice):
             :param to: The CECDevice to send the button press to
             :param button: The button to press
             :param auto_release: Should we automatically fire a button release command after press. Defautl to True
+            :param timeout: Time in seconds or Deadline allowed for both press and release. If None, LocalCECDevice.DEFAULT_TIMEOUT is used.
+                Once the press is sent, the release is always sent, with at least LocalCECDevice.RELEASE_MIN_TIMEOUT seconds
+                even if the deadline expired, so the button is never left held
+            :raise CommandTimeoutException: If the press did not complete in time, after trying to send the release anyway
         """
-        result = self.run_cec_ctl(['--to', to.logical_address, '--user-control-pressed', 'ui-cmd={}'.format(button.value['str'])])
+        deadline = Deadline.of(timeout)
+        try :
+            result = self.run_cec_ctl(['--to', to.logical_address, '--user-control-pressed', 'ui-cmd={}'.format(button.value['str'])],
+                                      timeout=deadline)
+        except CommandTimeoutException :
+            # The press might have been sent before cec-ctl was killed, release anyway so the button is not left held
+            if auto_release :
+                try :
+                    self.send_button_release(to=to, timeout=self.__get_release_deadline(deadline))
+                except (subprocess.CalledProcessError, CommandTimeoutException) :
+                    pass
+            raise
+
         if auto_release:
-            self.send_button_release(to=to)
+            self.send_button_release(to=to, timeout=self.__get_release_deadline(deadline))
+
         return result
 
 
-    def send_button_release(self, to: CECDevice) -> CompletedProcess:
+    def __get_release_deadline(self, deadline: Deadline) -> Deadline:
+        """
+            Return the deadline to use for a button release following a press with the given deadline,
+            leaving it at least LocalCECDevice.RELEASE_MIN_TIMEOUT seconds
+
+            :param deadline: The deadline of the button press
+        """
+        left = deadline.left()
+        if left is None or left >= self.RELEASE_MIN_TIMEOUT :
+            return deadline
+
+        return Deadline(self.RELEASE_MIN_TIMEOUT)
+
+
+    def send_button_press_many(self, to: list, button: CECButton, auto_release = True, timeout = None) -> dict:
+        """
+            Send a CEC command emulating a user pressing a button to multiple devices at once
+            User control messages cannot be broadcast, so one message per device is sent, pipelined back-to-back
+
+            :param to: The list of CECDevice to send the button press to
+            :param button: The button to press
+            :param auto_release: Should we automatically fire a button release command after press. Defautl to True
+            :param timeout: Time in seconds or Deadline allowed for the whole operation. If None, LocalCECDevice.DEFAULT_TIMEOUT is used.
+                Once the presses are sent, the releases are always sent to every target, with at least 
+                LocalCECDevice.RELEASE_MIN_TIMEOUT seconds even if the deadline expired, so no button is left held
+            :return: A dict indexed by target logical address, see send_power_off_many. If the press succeeded but not the release,
+                the release exception is reported
+        """
+        deadline = Deadline.of(timeout)
+        commands_args = [['--to', device.logical_address, '--user-control-pressed', 'ui-cmd={}'.format(button.value['str'])] 
+                         for device in to]
+        results = self.__send_to_many(to, commands_args, timeout=deadline)
+
+        if auto_release :
+            # Release every target, including the ones whose press timed out as it might have been sent before cec-ctl was killed
+            commands_args = [['--to', device.logical_address, '--user-control-released'] for device in to]
+            releases = self.run_cec_ctl_many(commands_args, timeout=self.__get_release_deadline(deadline))
+            for device, release in zip(to, releases) :
+                if isinstance(release, Exception) and isinstance(results[device.logical_address], CompletedProcess) :
+                    results[device.logical_address] = release
+
+        return results
+
+
+    def send_button_release(self, to: CECDevice, timeout = None) -> CompletedProcess:
         """
             Send a CEC command emulating a user releasing the last pressed button
 
             :param to: The CECDevice to send the button release to
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
         """
-        return self.run_cec_ctl(['--to', to.logical_address, '--user-control-released'])
+        return self.run_cec_ctl(['--to', to.logical_address, '--user-control-released'], timeout=timeout)
     
 
-    def send_volume_up(self, to: CECDevice) -> None:
+    def send_volume_up(self, to: CECDevice, timeout = None) -> None:
         """
             Send a CEC signal to emulate the volume-up button beeing pressed, then released
 
             :param to: Target CECDevice
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
         """
-        self.send_button_press(to=to, button=CECButton.VOLUME_UP)
+        self.send_button_press(to=to, button=CECButton.VOLUME_UP, timeout=timeout)
         return
     
 
-    def send_volume_down(self, to: CECDevice) -> None:
+    def send_volume_down(self, to: CECDevice, timeout = None) -> None:
         """
             Send a CEC signal to emulate the volume-down button beeing pressed, then released
 
             :param to: Target CECDevice
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
         """
-        self.send_button_press(to=to, button=CECButton.VOLUME_DOWN)
+        self.send_button_press(to=to, button=CECButton.VOLUME_DOWN, timeout=timeout)
         return
     
 
-    def ask_power_status(self, to: CECDevice) -> str:
+    def ask_power_status(self, to: CECDevice, timeout = None) -> str:
         """
             Send a CEC signal to ask a device to report his power status
 
             :param to: The target CECDevice
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
             :return: a string indicating the device power status among ('on', 'standby', 'to-on', 'to-standby')
         """
-        result = self.run_cec_ctl(['--to', to.logical_address, '--give-device-power-status'])
+        result = self.run_cec_ctl(['--to', to.logical_address, '--give-device-power-status'], timeout=timeout)
         result.check_returncode()
 
         match = re.match(self.REGEX_RESPONSE_PWR_STATE, result.stdout)
         if not match:
             raise Exception('Cannot find power status in ask_power_status response')
         
+        self.remember_state(to.logical_address, self.STATE_POWER_STATUS, match.group(1))
         return match.group(1)
     
 
-    def send_power_off(self, to: CECDevice) -> CompletedProcess:
+    def send_power_off(self, to: CECDevice, force: bool = False, timeout = None) -> CompletedProcess:
         """
             Send a CEC signal to put target device in standby mode
             standby is a low energy mode (almost like power off) letting device respond to HDMI-CEC command
@@ -271,11 +775,48 @@ class LocalCECDevice (CECDevice):
             device behavior might vary
 
             :param to: The CECDevice to put in standby mode
+            :param force: If True, always send the command even if the device is known to be in standby. Default to False
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+            :return: The cec-ctl result, or None if the command was skipped as redundant
+        """
+        if to.logical_address in (self.TV_ADDRESS, self.BROADCAST_ADDRESS) :
+            self.__forget_active_source()
+
+        if self.__is_redundant(to.logical_address, self.STATE_POWER_STATUS, 'standby', force):
+            return None
+
+        result = self.run_cec_ctl(['--to', to.logical_address, '--standby'], timeout=timeout)
+        self.__record_sent(to.logical_address, self.STATE_POWER_STATUS, 'standby')
+        return result
+
+
+    def send_power_off_many(self, to: list, broadcast: bool = False, force: bool = False, timeout = None) -> dict:
         """
-        return self.run_cec_ctl(['--to', to.logical_address, '--standby'])
+            Send a CEC signal to put multiple devices in standby mode at once, see send_power_off
+
+            By default one message per device is sent, pipelined back-to-back.
+            If broadcast is True, a single standby message is sent to the broadcast address instead, this is the fastest way
+            but be aware that **every** device on the bus will go to standby, not only the ones in to. 
+            A broadcast is never skipped as redundant
+
+            :param to: The list of CECDevice to put in standby mode
+            :param broadcast: If True, send a single broadcast message instead of one message per device. Default to False
+            :param force: If True, always send the command even if a device is known to be in standby. Default to False
+            :param timeout: Time in seconds or Deadline allowed for the whole operation. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+            :return: A dict indexed by target logical address with, for each device, either the cec-ctl result, None if the command
+                was skipped as redundant, or the exception raised (CalledProcessError or CommandTimeoutException)
+        """
+        # Whatever the targets, once devices went to standby we cannot be sure to still be the active source
+        self.__forget_active_source()
+
+        commands_args = [['--to', device.logical_address, '--standby'] for device in to]
+        broadcast_args = ['--to', self.BROADCAST_ADDRESS, '--standby'] if broadcast else None
 
+        return self.__send_to_many(to, commands_args, timeout=timeout, state=self.STATE_POWER_STATUS, value='standby', 
+                                   force=force, broadcast_args=broadcast_args)
 
-    def send_power_on(self, to: CECDevice) -> CompletedProcess:
+
+    def send_power_on(self, to: CECDevice, force: bool = False, timeout = None) -> CompletedProcess:
         """
             Send a CEC signal to power on target device and try to acquire signal
             this is technically the 'image view on' command.
@@ -284,11 +825,34 @@ class LocalCECDevice (CECDevice):
             device behavior might vary
 
             :param to: The CECDevice to power on
+            :param force: If True, always send the command even if the device is known to be on. Default to False
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+            :return: The cec-ctl result, or None if the command was skipped as redundant
         """
-        return self.run_cec_ctl(['--to', to.logical_address, '--image-view-on'])
+        if self.__is_redundant(to.logical_address, self.STATE_POWER_STATUS, 'on', force):
+            return None
+
+        result = self.run_cec_ctl(['--to', to.logical_address, '--image-view-on'], timeout=timeout)
+        self.__record_sent(to.logical_address, self.STATE_POWER_STATUS, 'on')
+        return result
     
     
-    def broadcast_active_source(self) -> CompletedProcess:
+    def send_power_on_many(self, to: list, force: bool = False, timeout = None) -> dict:
+        """
+            Send a CEC signal to power on multiple devices at once, see send_power_on
+            Image view on messages cannot be broadcast, so one message per device is sent, pipelined back-to-back
+
+            :param to: The list of CECDevice to power on
+            :param force: If True, always send the command even if a device is known to be on. Default to False
+            :param timeout: Time in seconds or Deadline allowed for the whole operation. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+            :return: A dict indexed by target logical address, see send_power_off_many
+        """
+        commands_args = [['--to', device.logical_address, '--image-view-on'] for device in to]
+
+        return self.__send_to_many(to, commands_args, timeout=timeout, state=self.STATE_POWER_STATUS, value='on', force=force)
+
+
+    def broadcast_active_source(self, force: bool = False, timeout = None) -> CompletedProcess:
         """
             Broadcast a CEC signal to indicate this device started transmitting a stream
 
@@ -297,11 +861,20 @@ class LocalCECDevice (CECDevice):
 
             I you want a more reliable way to select video input, you should consider using send_button_press with 
             input select button
+
+            :param force: If True, always send the command even if we are known to be the active source. Default to False
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+            :return: The cec-ctl result, or None if the command was skipped as redundant
         """
-        return self.run_cec_ctl(['--active-source', 'phys-addr={}'.format(self.physical_address)])
+        if self.__is_redundant(self.logical_address, self.STATE_ACTIVE_SOURCE, True, force):
+            return None
+
+        result = self.run_cec_ctl(['--active-source', 'phys-addr={}'.format(self.physical_address)], timeout=timeout)
+        self.__record_sent(self.logical_address, self.STATE_ACTIVE_SOURCE, True)
+        return result
     
 
-    def broadcast_inactive_source(self) -> CompletedProcess:
+    def broadcast_inactive_source(self, timeout = None) -> CompletedProcess:
         """
             Broadcast a CEC signal to indicate this device stopped transmitting a stream
 
@@ -310,21 +883,26 @@ class LocalCECDevice (CECDevice):
 
             I you want a more reliable way to select video input, you should consider using send_button_press with 
             input select button
+
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
         """
-        return self.run_cec_ctl(['--inactive-source', 'phys-addr={}'.format(self.physical_address)])
+        result = self.run_cec_ctl(['--inactive-source', 'phys-addr={}'.format(self.physical_address)], timeout=timeout)
+        self.remember_state(self.logical_address, self.STATE_ACTIVE_SOURCE, False, ttl=self.sent_state_ttl)
+        return result
     
 
-    def broadcast_request_active_source(self) -> list:
+    def broadcast_request_active_source(self, timeout = None) -> list:
         """
             Broadcast a CEC signal to ask every devices to report if he is an active source
              
             Behavior might be quite erratic depending on how well devices adhere to CEC norms.
             That mean you could very well have an active source, yet having no response in request_active_source.
 
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
             :raise: Raise exception if command fail or timeout
             :return: A list of active sources physical addresses as strings
         """
-        result = self.run_cec_ctl(['--request-active-source'])
+        result = self.run_cec_ctl(['--request-active-source'], timeout=timeout)
         result.check_returncode()
         if re.match(self.REGEX_RESPONSE_TIMEOUT, result.stdout):
             raise ResponseTimeoutException('Timeout when requesting active source. Either no active source, or device loosely follow CEC standard.')
@@ -346,4 +924,8 @@ class LocalCECDevice (CECDevice):
         if active_source != None :
             active_sources.append(active_source)
 
+        # Keep track of whether we are the active source or not
+        is_active_source = any(source['physical_address'] == self.physical_address for source in active_sources)
+        self.remember_state(self.logical_address, self.STATE_ACTIVE_SOURCE, is_active_source)
+
         return active_sources
\ No newline at end of file
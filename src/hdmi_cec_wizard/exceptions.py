@@ -18,4 +18,19 @@ class ResponseTimeoutException (Exception) :
     """
         This exception is raised when a command issued by cec-ctl have received a Timeout response
     """
-    pass
\ No newline at end of file
+    pass
+
+
+class CommandTimeoutException (ResponseTimeoutException) :
+    """
+        This exception is raised when a cec-ctl command did not complete before its deadline.
+        The cec-ctl process have been killed before raising.
+
+        You can access the timeout (in seconds) that expired in timeout
+    """
+    def __init__(self, message, timeout):
+        # Call the base class constructor with the parameters it needs
+        super().__init__(message)
+
+        self.timeout = timeout
+    pass
@@ -3,11 +3,25 @@ from subprocess import CompletedProcess
 import re
 import shlex
 import glob
-from .cec_device import CECDevice, LocalCECDevice, DeviceTypes
+from .cec_device import CECDevice, LocalCECDevice, DeviceTypes, Deadline, ReadWriteLock, run_command
 import shutil
 import signal
-from .exceptions import FollowerStoppedException
+import threading
+from .exceptions import FollowerStoppedException, CommandTimeoutException
 import time
+from typing import NamedTuple
+
+
+class DevicesSnapshot (NamedTuple):
+    """
+        Immutable snapshot of the connected devices, published at once so main_screen always belong to connected_devices
+
+        :connected_devices: Tuple of all the connected CECDevice, None if not listed yet
+        :main_screen: The main screen among connected_devices, None if not found
+    """
+    connected_devices: tuple = None
+    main_screen: CECDevice = None
+
 
 class HDMICECWizard ():
     """
@@ -16,6 +30,14 @@ class HDMICECWizard ():
 
         :param cec_handle: The /dev/cecX to use with HDMICECWizard, can be null on init but must be set before init.
         :type device: string|None
+
+        Every method talking on the bus accept a timeout, in seconds or as a Deadline, covering the whole operation.
+        If None LocalCECDevice.DEFAULT_TIMEOUT is used. If the operation did not complete before, a CommandTimeoutException is raised.
+
+        A wizard can be shared between threads. local_device and devices are never modified in place but replaced by new objects,
+        so reading them never block, and to read both connected_devices and main_screen consistently, read them from a single
+        devices snapshot. (Re)configuration methods are serialized by config_lock, and the adapter is only reconfigured once
+        no command is being sent, as commands hold bus_lock shared while reconfiguration hold it exclusively.
     """
 
     # Regex for parsing results from cec-ctl
@@ -45,11 +67,46 @@ class HDMICECWizard ():
         # will be initialized by calling self.start_follower or with self.init_cec
         self.local_device: LocalCECDevice = None
         
-        # All connected devices
-        self.connected_devices: list[CECDevice] = None
+        # All connected devices and the main screen to be used to show images,
+        # as an immutable snapshot replaced on each autoconfig
+        self.devices = DevicesSnapshot()
+
+        # Serialize the methods (re)configuring the wizard, readers never need it
+        self.config_lock = threading.RLock()
+
+        # Shared by every command sent on the bus, taken exclusively while (re)configuring the adapter
+        self.bus_lock = ReadWriteLock()
 
-        # The main screen to be used to show images
-        self.main_screen: CECDevice = None
+        # How the last init_cec went, see init_cec return
+        self.last_init: dict = None
+
+
+    @property
+    def connected_devices(self) -> tuple:
+        """
+            All connected devices, from the current devices snapshot
+        """
+        return self.devices.connected_devices
+
+
+    @connected_devices.setter
+    def connected_devices(self, connected_devices: list) -> None:
+        with self.config_lock :
+            self.devices = self.devices._replace(connected_devices=None if connected_devices is None else tuple(connected_devices))
+
+
+    @property
+    def main_screen(self) -> CECDevice:
+        """
+            The main screen to be used to show images, from the current devices snapshot
+        """
+        return self.devices.main_screen
+
+
+    @main_screen.setter
+    def main_screen(self, main_screen: CECDevice) -> None:
+        with self.config_lock :
+            self.devices = self.devices._replace(main_screen=main_screen)
 
 
     def __on_follower_exit(self, signum: int, frame) -> None :
@@ -61,21 +118,25 @@ class HDMICECWizard ():
                 to choose what to do with this information
         """
         if signum == signal.SIGCHLD:
-            # Get the process result, this should be immediate as the process is supposed to be stopped
-            self.follower_handle = None 
+            # SIGCHLD is received for every child, including cec-ctl commands, so check the follower really stopped.
+            # We cannot take self.config_lock here as the interrupted thread might hold it
+            follower_handle = self.follower_handle
+            if follower_handle and follower_handle.poll() is not None :
+                self.follower_handle = None 
 
 
 
-    def __run_cec_ctl_cmd(self, command_args: list) -> CompletedProcess:
+    def __run_cec_ctl_cmd(self, command_args: list, timeout = None) -> CompletedProcess:
         """
             Run a cec-ctl command and return result
             :param command_args: Parameters to pass to cec-ctl command. 
-                all args will be escaped with shlex.join
+                all args are passed as is, without going through a shell
             :type command_args: array
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+
+            :raise CommandTimeoutException: If the command did not complete in time
         """
-        command = shlex.join(['cec-ctl'] + command_args)
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        return result
+        return run_command(['cec-ctl'] + command_args, timeout=timeout)
     
 
     def __parse_device_infos(self, raw: str, is_topo: bool = False) -> dict : 
@@ -134,7 +195,44 @@ class HDMICECWizard ():
         return cec_params
     
 
-    def autoconfig(self, device_type: DeviceTypes = None, osd_name: str = None, wait: float = 3) -> None:
+    def __get_matching_device_infos(self, raw: str, device_type: DeviceTypes, osd_name: str = None) -> dict :
+        """
+            Check if a cec-ctl driver info string describe an adapter already configured as requested
+
+            :param raw: The string to parse
+            :param device_type: The requested device type
+            :param osd_name: The requested OSD Name, if None the OSD Name cec-ctl set by default for device_type
+            :return: The device infos as returned by __parse_device_infos if the configuration match, else None
+        """
+        try :
+            device_params = self.__parse_device_infos(raw)
+        except Exception :
+            # Missing infos, most likely because no logical address is claimed yet
+            return None
+
+        if device_params['device_type'] != device_type :
+            return None
+
+        # Without OSD Name the reconfiguration would reset it to cec-ctl default, so an adapter named otherwise must be reconfigured
+        if not osd_name :
+            osd_name = device_type.value['osd_name']
+
+        # Unknown default OSD Name, we cannot tell if the adapter match
+        if osd_name is None :
+            return None
+
+        if device_params.get('osd_name', '') != osd_name :
+            return None
+
+        # Logical address 15 is the unregistered/broadcast address, meaning no address was claimed
+        if device_params['logical_address'] == LocalCECDevice.BROADCAST_ADDRESS :
+            return None
+
+        return device_params
+
+
+    def autoconfig(self, device_type: DeviceTypes = None, osd_name: str = None, wait: float = 3, suppress_redundant: bool = False, 
+                   timeout = None, force_reconfigure: bool = False) -> dict:
         """
             This method will autoconfig the HDMI-CEC Wizard, trying to automatically :
                 - Detect the /dev/cecX to use and set it
@@ -145,39 +243,66 @@ class HDMICECWizard ():
             :param device_type: The device type to configure our CEC device as. Must be one of DeviceTypes or None to default to Playback
             :param osd_name: The OSD Name to use for our device (max 14 chars), if None cec-ctl will use device type instead
             :param wait: Time in seconds to wait between init and list connected devices. This time is needed by some HDMI device
-                to detect us on the network and start talking
+                to detect us on the network and start talking. Not waited if the already configured adapter is reused
+            :param suppress_redundant: If True, skip power on/off and active source commands that would not change
+                anything according to the local device known-state cache. Default to False
+            :param timeout: Time in seconds or Deadline allowed for the whole autoconfig, wait included. If None, 
+                LocalCECDevice.DEFAULT_TIMEOUT is used, in which case the wait is not counted. If the wait would not leave 
+                any time to list the connected devices, a CommandTimeoutException is raised without waiting
+            :param force_reconfigure: If True, always reconfigure the adapter, see init_cec. Default to False
             :raise: This method will raise exception if any step fail
+            :return: How the initialization went, see init_cec
         """
-        if not self.cec_handle :
-            self.cec_handle = self.autodetect_cec_handle()
-        
-        self.init_cec(device_type=device_type, osd_name=osd_name)
-        time.sleep(wait)
-        self.connected_devices = self.list_connected_devices()
-        self.main_screen = self.autodetect_main_screen()
+        # By default the wait is not counted in the time allowed
+        if timeout is None and LocalCECDevice.DEFAULT_TIMEOUT is not None :
+            timeout = LocalCECDevice.DEFAULT_TIMEOUT + wait
+        deadline = Deadline.of(timeout)
+
+        with self.config_lock :
+            if not self.cec_handle :
+                self.cec_handle = self.autodetect_cec_handle(timeout=deadline)
+            
+            init = self.init_cec(device_type=device_type, osd_name=osd_name, suppress_redundant=suppress_redundant, timeout=deadline, 
+                                 force_reconfigure=force_reconfigure)
+
+            # Other devices already know us if we kept our logical address, no need to wait for them
+            if not init['reused'] :
+                left = deadline.left()
+                if left is not None and wait >= left :
+                    raise CommandTimeoutException('Not enough time left to wait {} seconds for other devices.'.format(wait), 
+                                                  deadline.timeout)
+                time.sleep(wait)
+
+            connected_devices = tuple(self.list_connected_devices(timeout=deadline))
+            self.devices = DevicesSnapshot(connected_devices, self.autodetect_main_screen(connected_devices))
+
+        return init
     
 
     def set_cec_handle(self, cec_handle: str) -> None:
         """
             Update the /dev/cecX device to use 
         """
-        self.cec_handle = cec_handle
+        with self.config_lock :
+            self.cec_handle = cec_handle
 
 
-    def autodetect_cec_handle(self) -> str:
+    def autodetect_cec_handle(self, timeout = None) -> str:
         """
             Try to autodetect the /dev/cecX port to use by checking which HDMI port is connected
             the autodectect only works if one and only one HDMI port is connected to a device.
             If no HDMI port is connected it will fail, same is true if more than one port is connected
+            :param timeout: Time in seconds or Deadline allowed for checking all the ports. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
             :return: The /dev/cecX to use if autodetect succeded
             :raise: Raise exception if autodetect fail
         """
 
+        deadline = Deadline.of(timeout)
         connected_devices = []
 
         cec_handles = glob.glob('/dev/cec*')
         for cec_handle in cec_handles :
-            result = self.__run_cec_ctl_cmd(['-d', cec_handle])
+            result = self.__run_cec_ctl_cmd(['-d', cec_handle], timeout=deadline)
             result.check_returncode()
 
             match = re.search(self.REGEX_PHYSICAL_ADDRESS, result.stdout)
@@ -212,68 +337,104 @@ class HDMICECWizard ():
             :raise: Start follower dont raise exception by himself, but when the cec-follower stop, 
                 the exception FollowerStoppedException will be triggered by __on_follower_exit()
         """
-        if not self.follower_handle :
+        with self.config_lock :
+            if self.follower_handle and self.follower_handle.poll() is None :
+                return
+
             bin_path = shutil.which('cec-follower')
             self.follower_handle = subprocess.Popen(shlex.join([bin_path, '-d', self.cec_handle]), shell=True, 
                                                     stderr=subprocess.PIPE, stdout=subprocess.PIPE)
             
             # In UNIX when a child process stop, the parent receive a SIGCHLD signal
             # we use that to trigger the self.__on_follower_exit in turn raising the Exception
-            signal.signal(signal.SIGCHLD, self.__on_follower_exit)
+            # Signal handlers can only be set from the main thread, from other threads we rely on the poll() above
+            if threading.current_thread() is threading.main_thread() :
+                signal.signal(signal.SIGCHLD, self.__on_follower_exit)
 
 
-    def init_cec(self, device_type: DeviceTypes = None, osd_name: str = None) -> None:
+    def init_cec(self, device_type: DeviceTypes = None, osd_name: str = None, suppress_redundant: bool = False, timeout = None, 
+                 force_reconfigure: bool = False) -> dict:
         """
             Init the CEC device to make it a playback device, capable of talking with other HDMI connected devices.
             The function will also start the cec-follower in background 
+
+            The current adapter configuration is read first, if it already has the requested device type and OSD name
+            and a claimed logical address, it is reused as is. This avoid the kernel dropping and re-claiming our
+            logical address, with some TVs briefly losing us as a source.
             
             :param device_type: The device type to configure our CEC device as. Must be one of DeviceTypes or None to default to Playback
             :param osd_name: The OSD Name to use for our device (max 14 chars), if None cec-ctl will use device type instead
+            :param suppress_redundant: If True, skip power on/off and active source commands that would not change
+                anything according to the local device known-state cache. Default to False
+            :param timeout: Time in seconds or Deadline allowed for the whole initialization. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
+            :param force_reconfigure: If True, always reconfigure the adapter even if its configuration already match. Default to False
 
             :raise: Raise exception if initalizatoin fail
+            :return: A dict with key 'reused', True if the already configured adapter was reused and False if it was reconfigured,
+                and key 'duration', the time in seconds the initialization took. Also stored in self.last_init
         """
+        start = time.monotonic()
+        deadline = Deadline.of(timeout)
 
-        if not self.cec_handle :
-            raise Exception('You must define the cec_handle on initialization or later with set_cec_handle() before init')
+        with self.config_lock :
+            if not self.cec_handle :
+                raise Exception('You must define the cec_handle on initialization or later with set_cec_handle() before init')
 
-        if not device_type :
-            device_type = DeviceTypes.PLAYBACK
+            if not device_type :
+                device_type = DeviceTypes.PLAYBACK
 
-        # Init our cec device
-        command = ['-d', self.cec_handle, device_type.value['param']]
-        if osd_name :
-            if len(osd_name) > 14 :
+            if osd_name and len(osd_name) > 14 :
                 raise Exception('OSD Name cannot exceed 14 characters.')
-            command = command + ['--osd-name', osd_name]
 
-        result = self.__run_cec_ctl_cmd(command)
-        result.check_returncode()
+            # Read the current adapter configuration, if it already match we can skip reconfiguration
+            device_params = None
+            if not force_reconfigure :
+                result = self.__run_cec_ctl_cmd(['-d', self.cec_handle], timeout=deadline)
+                if result.returncode == 0 :
+                    device_params = self.__get_matching_device_infos(result.stdout, device_type, osd_name)
 
-        # Read info about this device and set self.local_device as a LocalCECDevice
-        result = self.__run_cec_ctl_cmd(['-d', self.cec_handle])
-        result.check_returncode()
+            reused = device_params is not None
+            if not reused :
+                # Init our cec device
+                command = ['-d', self.cec_handle, device_type.value['param']]
+                if osd_name :
+                    command = command + ['--osd-name', osd_name]
+
+                # Reconfiguring the adapter drop its logical address, so wait for the commands being sent and hold the new ones
+                with self.bus_lock.write(deadline) :
+                    result = self.__run_cec_ctl_cmd(command, timeout=deadline)
+                result.check_returncode()
 
-        # Init our CEC device with params parsed from cec-ctl response
-        device_params = self.__parse_device_infos(result.stdout)
-        device_params['cec_handle'] = self.cec_handle
-        self.local_device = LocalCECDevice(**device_params)
+                # Read info about this device and set self.local_device as a LocalCECDevice
+                result = self.__run_cec_ctl_cmd(['-d', self.cec_handle], timeout=deadline)
+                result.check_returncode()
 
-        # Now that the device is initialized, we must also start our cec-follower
-        # this is required in order for our device to respond to pool request
-        # by the other devices in the network
-        self.start_follower()
+                # Init our CEC device with params parsed from cec-ctl response
+                device_params = self.__parse_device_infos(result.stdout)
 
-        return
+            device_params['cec_handle'] = self.cec_handle
+            device_params['suppress_redundant'] = suppress_redundant
+            device_params['bus_lock'] = self.bus_lock
+            self.local_device = LocalCECDevice(**device_params)
 
+            # Now that the device is initialized, we must also start our cec-follower
+            # this is required in order for our device to respond to pool request
+            # by the other devices in the network
+            self.start_follower()
 
-    def list_connected_devices(self) -> list:
+            self.last_init = {'reused': reused, 'duration': time.monotonic() - start}
+            return self.last_init
+
+
+    def list_connected_devices(self, timeout = None) -> list:
         """
             List CEC devices connected to our local device 
 
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
             :raise: Raise exception if cannot list connected devices
             :return: Return a list of all the connected devices accessible through or local device
         """
-        result = self.local_device.run_cec_ctl(['--show-topology'], skip_info=True)
+        result = self.local_device.run_cec_ctl(['--show-topology'], skip_info=True, timeout=timeout)
         result.check_returncode()
 
         raws = []
@@ -298,27 +459,31 @@ class HDMICECWizard ():
         return connected_devices
     
 
-    def autodetect_main_screen(self) -> CECDevice:
+    def autodetect_main_screen(self, connected_devices: list = None) -> CECDevice:
         """
             Try to find the main screen among the connected device
             For know we will consider the main screen is necessarily the one with physical address 0.0.0.0
 
-            To work the self.connected_devices list must have been populated, either manually with list_connected_devices
-            or automatically with self.autoconfig
+            :param connected_devices: The devices to search in. If None, self.connected_devices is used, in which case 
+                it must have been populated, either manually with list_connected_devices or automatically with self.autoconfig
         """
-        for device in self.connected_devices:
+        if connected_devices is None :
+            connected_devices = self.connected_devices
+
+        for device in connected_devices:
             if device.physical_address == '0.0.0.0' :
                 return device
     
 
-    def get_topology(self) -> list:
+    def get_topology(self, timeout = None) -> list:
         """
             Return the topology of the HDMI CEC devices connected to the system
 
+            :param timeout: Time in seconds or Deadline allowed for the command. If None, LocalCECDevice.DEFAULT_TIMEOUT is used
             :raise: Raise exception if cannot list connected devices
             :return: Return a tree-like structure of physical addresses of all the connected devices, with parent and childs
         """
-        result = self.local_device.run_cec_ctl(['--show-topology'])
+        result = self.local_device.run_cec_ctl(['--show-topology'], timeout=timeout)
         result.check_returncode()
 
         raw = []
@@ -0,0 +1,186 @@
+import os
+import stat
+import subprocess
+import threading
+import time
+
+import pytest
+
+from hdmi_cec_wizard import CECDevice, CECButton, LocalCECDevice, DeviceTypes, Deadline, CommandTimeoutException
+
+
+# Fake cec-ctl: every call is logged in cec-ctl.log and answer immediately, except:
+#   - target 1 is slow to answer, target 2 always fail
+#   - target 5 is slow to get button press and release, target 7 is too slow to get button press
+#   - every release of a button is logged after it completed
+FAKE_CEC_CTL = """#!/bin/sh
+echo "$@" >> "$(dirname "$0")/cec-ctl.log"
+case "$*" in
+    *"--to 1 "*) exec sleep 1;;
+    *"--to 2 "*) exit 1;;
+    *"--to 5 --user-control-pressed"*) exec sleep 0.4;;
+    *"--to 5 --user-control-released"*) sleep 0.3; echo "released 5" >> "$(dirname "$0")/cec-ctl.log";;
+    *"--to 7 --user-control-pressed"*) exec sleep 1;;
+    *"--user-control-released"*) echo "released $5" >> "$(dirname "$0")/cec-ctl.log";;
+    *--give-device-power-status*) printf "\\tpwr-state: on (0x00)\\n";;
+    *) echo "$@";;
+esac
+"""
+
+
+@pytest.fixture
+def fake_cec_ctl(tmp_path, monkeypatch):
+    path = tmp_path / 'cec-ctl'
+    path.write_text(FAKE_CEC_CTL)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', '{}{}{}'.format(tmp_path, os.pathsep, os.environ['PATH']))
+    return tmp_path / 'cec-ctl.log'
+
+
+@pytest.fixture
+def local_device():
+    return LocalCECDevice('/dev/cec0', '2.0', '1.0.0.0', '4', DeviceTypes.PLAYBACK, '0x000000', suppress_redundant=True)
+
+
+def make_device(logical_address: str) -> CECDevice:
+    return CECDevice('2.0', '0.0.0.0', logical_address, DeviceTypes.TV, '0x000000')
+
+
+def test_observed_power_status_suppress_redundant_power_on(fake_cec_ctl, local_device):
+    tv = make_device('0')
+
+    assert local_device.ask_power_status(tv) == 'on'
+    assert local_device.send_power_on(tv) is None
+    assert local_device.send_power_on(tv, force=True) is not None
+    assert local_device.get_command_stats() == {'sent': 1, 'skipped': 1}
+
+
+def test_sent_commands_are_not_cached_by_default(fake_cec_ctl, local_device):
+    local_device.broadcast_active_source()
+
+    assert local_device.broadcast_active_source() is not None
+
+
+def test_sent_commands_are_cached_with_sent_state_ttl(fake_cec_ctl, local_device):
+    local_device.sent_state_ttl = 60
+    local_device.broadcast_active_source()
+
+    assert local_device.broadcast_active_source() is None
+
+
+def test_power_off_tv_forgets_active_source(fake_cec_ctl, local_device):
+    local_device.sent_state_ttl = 60
+    tv = make_device('0')
+
+    local_device.broadcast_active_source()
+    local_device.send_power_off(tv)
+    local_device.send_power_on(tv)
+
+    assert local_device.broadcast_active_source() is not None
+
+
+def test_broadcast_power_off_updates_every_known_device(fake_cec_ctl, local_device):
+    local_device.sent_state_ttl = 60
+    tv = make_device('0')
+    everybody = make_device(LocalCECDevice.BROADCAST_ADDRESS)
+
+    local_device.send_power_on(tv)
+    local_device.send_power_off(everybody)
+    assert local_device.send_power_on(tv) is not None
+
+    assert local_device.send_power_off(everybody) is not None
+    assert LocalCECDevice.BROADCAST_ADDRESS not in local_device.known_states
+
+
+def test_failed_commands_are_not_counted_as_sent(fake_cec_ctl, local_device):
+    with pytest.raises(subprocess.CalledProcessError):
+        local_device.send_power_on(make_device('2'))
+
+    assert local_device.get_command_stats() == {'sent': 0, 'skipped': 0}
+
+
+def test_command_timeout_raises_expired_timeout(fake_cec_ctl, local_device):
+    with pytest.raises(CommandTimeoutException) as e:
+        local_device.send_power_on(make_device('1'), timeout=0.3)
+
+    assert e.value.timeout == 0.3
+    assert local_device.get_command_stats() == {'sent': 0, 'skipped': 0}
+
+
+def test_expired_deadline_reports_its_timeout(fake_cec_ctl, local_device):
+    deadline = Deadline(0.2)
+    with pytest.raises(CommandTimeoutException):
+        local_device.send_power_on(make_device('1'), timeout=deadline)
+
+    with pytest.raises(CommandTimeoutException) as e:
+        local_device.send_power_on(make_device('0'), timeout=deadline)
+    assert e.value.timeout == 0.2
+
+
+def test_button_release_gets_grace_time_after_deadline(fake_cec_ctl, local_device):
+    result = local_device.send_button_press(make_device('5'), CECButton.VOLUME_UP, timeout=0.5)
+
+    assert result.returncode == 0
+    assert 'released 5' in fake_cec_ctl.read_text()
+
+
+def test_button_release_is_sent_when_press_times_out(fake_cec_ctl, local_device):
+    with pytest.raises(CommandTimeoutException):
+        local_device.send_button_press(make_device('7'), CECButton.VOLUME_UP, timeout=0.3)
+
+    assert '--to 7 --user-control-released' in fake_cec_ctl.read_text()
+
+
+def test_many_collects_completed_commands_after_deadline(fake_cec_ctl, local_device):
+    local_device.sent_state_ttl = 60
+    slow, tv, audio = make_device('1'), make_device('0'), make_device('3')
+
+    results = local_device.send_power_on_many([slow, tv, audio], timeout=0.3)
+
+    assert isinstance(results['1'], CommandTimeoutException)
+    assert results['0'].returncode == 0 and results['3'].returncode == 0
+    assert local_device.send_power_on_many([tv, audio]) == {'0': None, '3': None}
+    assert local_device.get_command_stats() == {'sent': 2, 'skipped': 2}
+
+
+def test_many_failed_commands_are_not_counted_as_sent(fake_cec_ctl, local_device):
+    results = local_device.send_power_off_many([make_device('2'), make_device('0')])
+
+    assert isinstance(results['2'], subprocess.CalledProcessError)
+    assert local_device.get_command_stats() == {'sent': 1, 'skipped': 0}
+
+
+def test_broadcast_power_off_many_updates_every_known_device(fake_cec_ctl, local_device):
+    local_device.sent_state_ttl = 60
+    tv = make_device('0')
+
+    local_device.send_power_on(tv)
+    results = local_device.send_power_off_many([make_device('3')], broadcast=True)
+
+    assert results['3'].returncode == 0
+    assert '--to 15 --standby' in fake_cec_ctl.read_text()
+    assert local_device.send_power_on(tv) is not None
+    assert LocalCECDevice.BROADCAST_ADDRESS not in local_device.known_states
+
+
+def test_button_press_many_releases_every_started_press(fake_cec_ctl, local_device):
+    results = local_device.send_button_press_many([make_device('5'), make_device('7')], CECButton.VOLUME_UP, timeout=0.5)
+
+    assert results['5'].returncode == 0
+    assert isinstance(results['7'], CommandTimeoutException)
+    log = fake_cec_ctl.read_text()
+    assert 'released 5' in log and 'released 7' in log
+
+
+def test_concurrent_transmits_are_not_serialized(fake_cec_ctl, local_device):
+    # Target 1 take 1 second to answer
+    threads = [threading.Thread(target=local_device.send_power_on, args=(make_device('1'),)) for _ in range(2)]
+
+    start = time.monotonic()
+    for thread in threads :
+        thread.start()
+    for thread in threads :
+        thread.join()
+
+    assert time.monotonic() - start < 1.8
+    assert local_device.get_command_stats() == {'sent': 2, 'skipped': 0}
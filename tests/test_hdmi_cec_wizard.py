@@ -0,0 +1,156 @@
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+from hdmi_cec_wizard import HDMICECWizard, DeviceTypes, CommandTimeoutException
+
+
+# Fake cec-ctl: the adapter is reported as a claimed Playback device named 'Room', connected to a TV.
+# The adapter device type, OSD name and logical address can be changed with FAKE_DEVICE_TYPE, FAKE_OSD_NAME and FAKE_LOGICAL_ADDRESS.
+# Configuring the adapter and transmitting are slow and log when they begin and end in cec-ctl.log
+FAKE_CEC_CTL = """#!/bin/sh
+log="$(dirname "$0")/cec-ctl.log"
+case "$*" in
+    *--playback*) echo "configure begin" >> "$log"; sleep 0.4; echo "configure end" >> "$log";;
+    *"--to "*) echo "transmit begin" >> "$log"; sleep 0.4; echo "transmit end" >> "$log"; exit 0;;
+    *--show-topology*)
+        printf "\\tSystem Information for device 0 (TV) from device 4 (Playback Device 1):\\n"
+        printf "\\t\\tCEC Version                : 2.0\\n"
+        printf "\\t\\tPhysical Address           : 0.0.0.0\\n"
+        printf "\\t\\tPrimary Device Type        : TV\\n"
+        printf "\\t\\tVendor ID                  : 0x00e091\\n"
+        printf "\\t\\tOSD Name                   : 'TV'\\n"
+        printf "\\n\\tTopology:\\n\\n\\t0.0.0.0: TV\\n\\t    1.0.0.0: Playback Device 1\\n"
+        exit 0;;
+esac
+printf "Driver Info:\\n"
+printf "\\tCEC Version                : 2.0\\n"
+printf "\\tPhysical Address           : 1.0.0.0\\n"
+printf "\\tLogical Address            : ${FAKE_LOGICAL_ADDRESS:-4} (Playback Device 1)\\n"
+printf "\\tPrimary Device Type        : ${FAKE_DEVICE_TYPE:-Playback}\\n"
+printf "\\tVendor ID                  : 0x000c03\\n"
+printf "\\tOSD Name                   : '${FAKE_OSD_NAME-Room}'\\n"
+"""
+
+FAKE_CEC_FOLLOWER = """#!/bin/sh
+exec sleep 30
+"""
+
+
+@pytest.fixture
+def wizard(tmp_path, monkeypatch):
+    for name, content in (('cec-ctl', FAKE_CEC_CTL), ('cec-follower', FAKE_CEC_FOLLOWER)):
+        path = tmp_path / name
+        path.write_text(content)
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', '{}{}{}'.format(tmp_path, os.pathsep, os.environ['PATH']))
+
+    wizard = HDMICECWizard('/dev/cec0')
+    wizard.log = tmp_path / 'cec-ctl.log'
+    yield wizard
+
+    if wizard.follower_handle :
+        wizard.follower_handle.kill()
+
+
+def test_autoconfig_does_not_wait_past_deadline(wizard):
+    start = time.monotonic()
+    with pytest.raises(CommandTimeoutException) as e:
+        wizard.autoconfig(wait=3, timeout=1)
+
+    assert time.monotonic() - start < 1
+    assert e.value.timeout == 1
+
+
+def test_autoconfig_publishes_devices_snapshot(wizard):
+    wizard.autoconfig(wait=0)
+
+    devices = wizard.devices
+    assert isinstance(devices.connected_devices, tuple)
+    assert devices.main_screen.logical_address == '0'
+    assert devices.main_screen in devices.connected_devices
+    assert wizard.main_screen is devices.main_screen
+
+
+def test_reconfiguration_waits_for_transmits_in_flight(wizard):
+    wizard.autoconfig(wait=0)
+    wizard.log.unlink()
+
+    transmit = threading.Thread(target=wizard.local_device.send_power_on, args=(wizard.main_screen,))
+    transmit.start()
+    time.sleep(0.1)
+    wizard.init_cec()
+    transmit.join()
+
+    assert wizard.log.read_text().split('\n')[:4] == ['transmit begin', 'transmit end', 'configure begin', 'configure end']
+
+
+def test_transmits_wait_for_reconfiguration(wizard):
+    wizard.autoconfig(wait=0)
+    wizard.log.unlink()
+
+    configure = threading.Thread(target=wizard.init_cec)
+    configure.start()
+    time.sleep(0.1)
+    wizard.local_device.send_power_on(wizard.main_screen)
+    configure.join()
+
+    assert wizard.log.read_text().split('\n')[:4] == ['configure begin', 'configure end', 'transmit begin', 'transmit end']
+
+
+def test_init_cec_reuses_matching_adapter(wizard):
+    init = wizard.init_cec(osd_name='Room')
+
+    assert init['reused']
+    assert wizard.last_init is init
+    assert wizard.local_device.logical_address == '4'
+    assert not wizard.log.exists()
+
+
+def test_init_cec_reconfigures_custom_osd_name_without_osd_name(wizard):
+    assert not wizard.init_cec()['reused']
+    assert 'configure end' in wizard.log.read_text()
+
+
+def test_init_cec_force_reconfigure(wizard):
+    assert not wizard.init_cec(osd_name='Room', force_reconfigure=True)['reused']
+
+
+def test_autoconfig_does_not_wait_when_reused(wizard):
+    start = time.monotonic()
+    assert wizard.autoconfig(osd_name='Room', wait=3)['reused']
+
+    assert time.monotonic() - start < 3
+    assert wizard.main_screen.logical_address == '0'
+
+
+# Adapter as left by cec-ctl configuring each device type without --osd-name, and whether it can be reused
+@pytest.mark.parametrize('device_type, osd_name, logical_address, reused', [
+    (DeviceTypes.TV, 'TV', '0', True),
+    (DeviceTypes.RECORDER, 'Record', '1', True),
+    (DeviceTypes.TUNER, 'Tuner', '3', True),
+    (DeviceTypes.PLAYBACK, 'Playback', '4', True),
+    (DeviceTypes.AUDIO, 'Audio System', '5', True),
+    (DeviceTypes.PROCESSOR, 'Processor', '14', True),
+    # Default OSD name unknown, always reconfigured
+    (DeviceTypes.AMPLIFIER, 'Amplifier', '5', False),
+    # Configured unregistered, without OSD name, so never claim a logical address
+    (DeviceTypes.SWITCH, '', '15', False),
+])
+def test_init_cec_compares_default_osd_name_per_device_type(wizard, monkeypatch, device_type, osd_name, logical_address, reused):
+    monkeypatch.setenv('FAKE_DEVICE_TYPE', device_type.value['str'])
+    monkeypatch.setenv('FAKE_OSD_NAME', osd_name)
+    monkeypatch.setenv('FAKE_LOGICAL_ADDRESS', logical_address)
+
+    assert wizard.init_cec(device_type=device_type)['reused'] == reused
+
+
+@pytest.mark.parametrize('device_type', [DeviceTypes.RECORDER, DeviceTypes.AUDIO])
+def test_init_cec_reconfigures_device_type_name_differing_from_default_osd_name(wizard, monkeypatch, device_type):
+    monkeypatch.setenv('FAKE_DEVICE_TYPE', device_type.value['str'])
+    monkeypatch.setenv('FAKE_OSD_NAME', device_type.value['str'])
+
+    assert not wizard.init_cec(device_type=device_type)['reused']